@@ -1,11 +1,14 @@
 import os
+import sys
 import json
 import time
 import asyncio
+import orjson
 import websockets
 from collections import defaultdict
+from functools import lru_cache
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 from synthetic_engine import SyntheticEngine, TimeframeConfig  # NEW
 
@@ -55,60 +58,95 @@ TF_CONFIGS = [
 
 engine = SyntheticEngine(TF_CONFIGS)
 
-# Queue for subscribe commands from HTTP handlers to WS loop
-pending_subs: asyncio.Queue = asyncio.Queue()
+# Live Finnhub connection; set by ws_loop while connected, None otherwise
+current_ws = None
+
+# Strong refs to in-flight subscribe sends so they are not garbage-collected
+_send_tasks = set()
 
 
 async def ws_loop():
     """Single WebSocket loop that keeps Finnhub connection alive
-    and listens for subscribe commands via pending_subs queue.
+    and publishes it as current_ws for ensure_subscribed.
     """
+    global current_ws
     while True:
         try:
-            async with websockets.connect(WS_URL) as ws:
-                # Subscribe to anything already in SUBS at connect time
-                for s in list(SUBS):
-                    await ws.send(json.dumps({"type": "subscribe", "symbol": s}))
-
-                while True:
-                    # Try to drain any pending subscription commands
-                    try:
-                        cmd = pending_subs.get_nowait()
-                    except asyncio.QueueEmpty:
-                        cmd = None
-
-                    if cmd:
-                        await ws.send(cmd)
-
-                    raw = await ws.recv()
-                    msg = json.loads(raw)
-                    data = msg.get("data") or []
-                    for d in data:
-                        sym = d["s"]
-                        px = d["p"]
-                        vol = d.get("v", 0.0)
-                        ts = d["t"] // 1000  # ms -> s
-
-                        # Update last tick
-                        tick[sym] = {"symbol": sym, "price": px, "ts": ts}
-
-                        # Feed synthetic engine for ALL timeframes
-                        engine.ingest_tick(sym, px, vol, ts)
+            # Finnhub frames are small JSON; skip permessage-deflate and
+            # allow bursty multi-tick frames up to 4 MiB. Text frames are still
+            # UTF-8 decoded by websockets (a single C-level bytes.decode); there is
+            # no public switch to hand raw bytes to orjson instead.
+            async with websockets.connect(WS_URL, compression=None, max_size=2**22) as ws:
+                # Publish first so symbols added while we resubscribe are sent directly
+                current_ws = ws
+                try:
+                    # Subscribe to anything already in SUBS at connect time
+                    for s in list(SUBS):
+                        await ws.send(json.dumps({"type": "subscribe", "symbol": s}))
+
+                    while True:
+                        raw = await ws.recv()
+                        msg = orjson.loads(raw)
+                        data = msg.get("data") or []
+                        for d in data:
+                            sym = d["s"]
+                            px = d["p"]
+                            vol = d.get("v", 0.0)
+                            ts = d["t"] // 1000  # ms -> s
+
+                            # Update last tick in place; allocate only on first sight
+                            last = tick.get(sym)
+                            if last is None:
+                                tick[sym] = {"symbol": sym, "price": px, "ts": ts}
+                            else:
+                                last["price"] = px
+                                last["ts"] = ts
+
+                            # Feed synthetic engine for ALL timeframes
+                            engine.ingest_tick(sym, px, vol, ts)
+                finally:
+                    current_ws = None
 
         except Exception as e:
             print("WS reconnect:", e)
             await asyncio.sleep(3)
 
 
-async def ensure_subscribed(symbol: str):
-    """Ensure symbol is in SUBS and queued for subscription."""
-    if symbol not in SUBS:
-        SUBS.add(symbol)
+async def _send_subscribe(ws, cmd: str):
+    try:
+        await ws.send(cmd)
+    except websockets.ConnectionClosed:
+        # ws_loop resubscribes everything in SUBS once it reconnects
+        pass
+
+
+def ensure_subscribed(symbol: str):
+    """Ensure symbol is in SUBS and, if connected, subscribed on the live socket.
+    While disconnected, ws_loop picks it up from SUBS on reconnect.
+    """
+    # Hot path: already subscribed, nothing to schedule
+    if symbol in SUBS:
+        return
+
+    SUBS.add(symbol)
+    if current_ws is not None:
         cmd = json.dumps({"type": "subscribe", "symbol": symbol})
-        await pending_subs.put(cmd)
+        task = asyncio.create_task(_send_subscribe(current_ws, cmd))
+        _send_tasks.add(task)
+        task.add_done_callback(_send_tasks.discard)
+
 
+# /synthetic/grid bodies: (symbol, tfs) -> (tick version, whole second, body)
+grid_cache = {}
+GRID_CACHE_MAX = 4096
 
-app = FastAPI()
+
+def orjson_response(obj) -> Response:
+    """Serialize with orjson and return a raw Response, skipping jsonable_encoder."""
+    return Response(orjson.dumps(obj), media_type="application/json")
+
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 @app.on_event("startup")
@@ -119,13 +157,13 @@ async def startup():
 @app.get("/live/price")
 async def live_price(symbol: str):
     # Dynamically subscribe if needed
-    await ensure_subscribed(symbol)
+    ensure_subscribed(symbol)
 
     data = tick.get(symbol)
     if not data:
         # We are subscribed but haven't received a tick yet
         raise HTTPException(status_code=404, detail="no tick yet for symbol")
-    return JSONResponse(data)
+    return orjson_response(data)
 
 
 @app.get("/live/candle")
@@ -134,12 +172,12 @@ async def live_candle(symbol: str, tf: str = "1m"):
     Backwards-compatible live candle endpoint.
     Uses SyntheticEngine under the hood (default tf=1m).
     """
-    await ensure_subscribed(symbol)
+    ensure_subscribed(symbol)
 
     bar = engine.get_candle(symbol, tf)
     if not bar:
         raise HTTPException(status_code=404, detail="no candle yet for symbol")
-    return JSONResponse(bar)
+    return Response(bar, media_type="application/json")
 
 
 @app.get("/synthetic/candle")
@@ -148,12 +186,18 @@ async def synthetic_candle(symbol: str, tf: str):
     Generic synthetic candle endpoint for arbitrary timeframe.
     Example: tf=1s,2s,5s,10s,12s,30s,1m,5m,15m,1h,day,week,month,quarter,year,2y,5y,10y
     """
-    await ensure_subscribed(symbol)
+    ensure_subscribed(symbol)
 
     bar = engine.get_candle(symbol, tf)
     if not bar:
         raise HTTPException(status_code=404, detail="no candle yet for symbol/tf")
-    return JSONResponse(bar)
+    return Response(bar, media_type="application/json")
+
+
+@lru_cache(maxsize=256)
+def _parse_tfs(tfs: str) -> tuple:
+    """Split a comma-separated tfs query into interned names; memoized per raw string."""
+    return tuple(sys.intern(x.strip()) for x in tfs.split(",") if x.strip())
 
 
 @app.get("/synthetic/grid")
@@ -165,15 +209,31 @@ async def synthetic_grid(
     Multi-timeframe grid endpoint.
     Returns a dict: { tf_name: candle_json } for requested tfs.
     """
-    await ensure_subscribed(symbol)
+    ensure_subscribed(symbol)
+
+    # Reuse the cached body if no tick has arrived since it was built and we are
+    # still in the same second; elapsed/remaining/complete only move per second.
+    now_ts = time.time()
+    now_s = int(now_ts)
+    version = engine.get_version(symbol)
+    key = (symbol, tfs)
+    cached = grid_cache.get(key)
+    if cached is not None and cached[0] == version and cached[1] == now_s:
+        return Response(cached[2], media_type="application/json")
 
-    tf_list = [x.strip() for x in tfs.split(",") if x.strip()]
     result = {}
-    for tf in tf_list:
-        bar = engine.get_candle(symbol, tf)
+    for tf in _parse_tfs(tfs):
+        bar = engine.get_candle(symbol, tf, now_ts)
         if bar:
             result[tf] = bar
 
     if not result:
         raise HTTPException(status_code=404, detail="no candles yet for symbol/tfs")
-    return JSONResponse(result)
+    # Splice the pre-serialized candles into one JSON object
+    body = b"{" + b",".join(orjson.dumps(tf) + b":" + bar for tf, bar in result.items()) + b"}"
+
+    # tfs comes from the client, so bound the number of cached variants
+    if len(grid_cache) >= GRID_CACHE_MAX:
+        grid_cache.clear()
+    grid_cache[key] = (version, now_s, body)
+    return Response(body, media_type="application/json")
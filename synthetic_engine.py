@@ -1,7 +1,11 @@
+import sys
 import time
+import numpy as np
+import orjson
 from datetime import datetime, timedelta
-from collections import defaultdict
-from typing import Dict, Optional, List, Literal
+from functools import lru_cache
+from numba import njit
+from typing import Dict, Optional, List, Literal, Tuple
 
 
 class TimeframeConfig:
@@ -25,49 +29,143 @@ class TimeframeConfig:
         self.years_span = years_span        # for multi-year (2y, 5y, 10y)
 
 
-class SyntheticCandle:
-    """
-    Tracks a single synthetic bar: start/end timestamps and OHLCV.
-    """
-    def __init__(self, start_ts: int, end_ts: int, price: float, volume: float = 0.0):
-        self.start_ts = int(start_ts)
-        self.end_ts = int(end_ts)
-        self.o = float(price)
-        self.h = float(price)
-        self.l = float(price)
-        self.c = float(price)
-        self.v = float(volume or 0.0)
-
-    def update(self, price: float, volume: float = 0.0):
-        p = float(price)
-        self.c = p
-        if p > self.h:
-            self.h = p
-        if p < self.l:
-            self.l = p
-        self.v += float(volume or 0.0)
-
-    def to_dict(self, now_ts: Optional[float] = None) -> Dict:
-        now_ts = now_ts or time.time()
-        elapsed = max(0, int(now_ts - self.start_ts))
-        total = max(1, int(self.end_ts - self.start_ts))
-        remaining = max(0, total - elapsed)
-        complete = now_ts >= self.end_ts
-
-        start_dt = datetime.utcfromtimestamp(self.start_ts)
-        iso_start = start_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        return {
-            "t": iso_start,
-            "o": self.o,
-            "h": self.h,
-            "l": self.l,
-            "c": self.c,
-            "v": self.v,
-            "elapsed": elapsed,
-            "remaining": remaining,
-            "complete": complete,
-        }
+@lru_cache(maxsize=4096)
+def _iso_start(start_ts: int) -> str:
+    """
+    Format a bar start as ISO-8601 UTC; bar starts repeat across ticks and symbols.
+    """
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start_ts))
+
+
+def _ohlcv_bytes(iso_start: str, o: float, h: float, l: float, c: float, v: float) -> bytes:
+    """
+    Serialize the tick-dependent part of a candle.
+    The closing brace is dropped so the time fields can be appended.
+    """
+    return orjson.dumps({
+        "t": iso_start,
+        "o": o,
+        "h": h,
+        "l": l,
+        "c": c,
+        "v": v,
+    })[:-1]
+
+
+def _with_time_fields(prefix: bytes, start_ts: int, end_ts: int, now_ts: Optional[float]) -> bytes:
+    """
+    Append the clock-dependent elapsed/remaining/complete fields to a cached prefix.
+    """
+    now_ts = now_ts or time.time()
+    elapsed = max(0, int(now_ts - start_ts))
+    total = max(1, int(end_ts - start_ts))
+    remaining = max(0, total - elapsed)
+    complete = b"true" if now_ts >= end_ts else b"false"
+
+    return b'%s,"elapsed":%d,"remaining":%d,"complete":%s}' % (
+        prefix, elapsed, remaining, complete,
+    )
+
+
+# Column layout of SymState.ohlcv and SymState.bounds
+O, H, L, C, V = 0, 1, 2, 3, 4
+START, END = 0, 1
+
+# Length of the base bar that lazy timeframes are folded from
+BASE_SECONDS = 60
+
+
+@njit(cache=True)
+def _start_bar(ohlcv, i, px, vol):
+    """
+    Open a fresh bar in slot i from a single tick.
+    """
+    ohlcv[i, O] = px
+    ohlcv[i, H] = px
+    ohlcv[i, L] = px
+    ohlcv[i, C] = px
+    ohlcv[i, V] = vol
+
+
+@njit(cache=True)
+def _fold_tick(ohlcv, i, px, vol):
+    """
+    Fold a tick into the open bar in slot i.
+    """
+    ohlcv[i, C] = px
+    if px > ohlcv[i, H]:
+        ohlcv[i, H] = px
+    if px < ohlcv[i, L]:
+        ohlcv[i, L] = px
+    ohlcv[i, V] += vol
+
+
+@njit(cache=True)
+def _update_duration_tfs(bounds, ohlcv, sizes, ts, px, vol):
+    """
+    Roll or update the leading eager (per-tick) duration slots of one symbol.
+    Only the start is stored; the end is always start + size and is derived on read.
+    """
+    for i in range(sizes.shape[0]):
+        new_start = ts - ts % sizes[i]
+        if new_start != bounds[i, START]:
+            bounds[i, START] = new_start
+            _start_bar(ohlcv, i, px, vol)
+        else:
+            _fold_tick(ohlcv, i, px, vol)
+
+
+@njit(cache=True)
+def _merge_bar(bounds, ohlcv, src, i, start, end):
+    """
+    Fold the closed bar in slot src into slot i, opening a new bar in i if its bounds changed.
+    """
+    if start != bounds[i, START] or end != bounds[i, END]:
+        bounds[i, START] = start
+        bounds[i, END] = end
+        for k in range(5):
+            ohlcv[i, k] = ohlcv[src, k]
+    else:
+        if ohlcv[src, H] > ohlcv[i, H]:
+            ohlcv[i, H] = ohlcv[src, H]
+        if ohlcv[src, L] < ohlcv[i, L]:
+            ohlcv[i, L] = ohlcv[src, L]
+        ohlcv[i, C] = ohlcv[src, C]
+        ohlcv[i, V] += ohlcv[src, V]
+
+
+@njit(cache=True)
+def _fold_base_bar(bounds, ohlcv, base, base_start, first_lazy, lazy_sizes, cal_bounds):
+    """
+    Fold the closed base bar into every lazy slot: lazy durations first, then calendar.
+    """
+    for j in range(lazy_sizes.shape[0]):
+        start = base_start - base_start % lazy_sizes[j]
+        _merge_bar(bounds, ohlcv, base, first_lazy + j, start, start + lazy_sizes[j])
+    first_cal = first_lazy + lazy_sizes.shape[0]
+    for j in range(cal_bounds.shape[0]):
+        _merge_bar(bounds, ohlcv, base, first_cal + j, cal_bounds[j, START], cal_bounds[j, END])
+
+
+class SymState:
+    """
+    Bars for one symbol, one row per timeframe slot:
+    ohlcv[n_slots, 5] float64 and bounds[n_slots, 2] int64 (start, end).
+    Eager slots hold the open bar; lazy slots hold the fold of closed base bars
+    and are merged with the open base bar on read.
+    """
+    def __init__(self, n_slots: int):
+        self.ohlcv = np.zeros((n_slots, 5), dtype=np.float64)
+        # A start of -1 never matches a real bar start, so the first tick rolls every slot.
+        # END is not maintained for eager duration slots; their end is derived from start.
+        self.bounds = np.zeros((n_slots, 2), dtype=np.int64)
+        self.bounds[:, START] = -1
+        # Start of the open base bar, mirrored as a Python int for the per-tick check
+        self.base_start = -1
+        # (OHLCV prefix, start_ts, end_ts) per rendered slot; cleared on every tick
+        self._bytes: Dict[int, Tuple[bytes, int, int]] = {}
+        # Bumped on every tick so readers can tell whether cached output is stale
+        self.version = 0
 
 
 class SyntheticEngine:
@@ -76,16 +174,60 @@ class SyntheticEngine:
 
     Maintains latest candle for each (symbol, timeframe).
     For live use: ingest_tick() is called for each real tick.
+
+    Only timeframes that cannot be built from whole base (1m) bars are updated
+    per tick. Longer durations and calendar timeframes are lazy: a base bar is
+    folded into them when it closes, and the open base bar is merged in on read.
     """
     def __init__(self, tf_configs: List[TimeframeConfig]):
-        # state[symbol][tf_name] = SyntheticCandle
-        self.state: Dict[str, Dict[str, SyntheticCandle]] = defaultdict(dict)
+        self.state: Dict[str, SymState] = {}
         self.tf_configs: Dict[str, TimeframeConfig] = {cfg.name: cfg for cfg in tf_configs}
 
-    def _bounds_duration(self, ts: int, size_seconds: int):
-        start_ts = ts - (ts % size_seconds)
-        end_ts = start_ts + size_seconds
-        return int(start_ts), int(end_ts)
+        dur_cfgs = [cfg for cfg in self.tf_configs.values() if cfg.kind == "duration"]
+        cal_cfgs = [cfg for cfg in self.tf_configs.values() if cfg.kind != "duration"]
+        lazy_dur_cfgs = [
+            cfg for cfg in dur_cfgs
+            if cfg.size_seconds > BASE_SECONDS and cfg.size_seconds % BASE_SECONDS == 0
+        ]
+        eager_cfgs = [cfg for cfg in dur_cfgs if cfg not in lazy_dur_cfgs]
+
+        # SymState slot layout: eager durations (plus an unnamed base slot if no
+        # configured timeframe can serve as one), lazy durations, calendar timeframes
+        layout: List[Optional[TimeframeConfig]] = list(eager_cfgs)
+        self._base: Optional[int] = None
+        if lazy_dur_cfgs or cal_cfgs:
+            eager_sizes = [cfg.size_seconds for cfg in eager_cfgs]
+            if BASE_SECONDS in eager_sizes:
+                self._base = eager_sizes.index(BASE_SECONDS)
+            else:
+                self._base = len(layout)
+                layout.append(None)
+        self._first_lazy = len(layout)
+        self._first_cal = self._first_lazy + len(lazy_dur_cfgs)
+        layout += lazy_dur_cfgs + cal_cfgs
+
+        self._slots: Dict[str, int] = {
+            sys.intern(cfg.name): i for i, cfg in enumerate(layout) if cfg is not None
+        }
+        self._n_slots = len(layout)
+        self._eager_sizes = np.array(
+            [cfg.size_seconds if cfg else BASE_SECONDS for cfg in layout[:self._first_lazy]],
+            dtype=np.int64,
+        )
+        self._lazy_sizes = np.array([cfg.size_seconds for cfg in lazy_dur_cfgs], dtype=np.int64)
+        # Per-slot bar length for the read path; None for calendar slots
+        self._slot_sizes: Tuple[Optional[int], ...] = tuple(
+            cfg.size_seconds if cfg is not None and cfg.kind == "duration" else None
+            for cfg in layout
+        )
+
+        # Frozen (scratch index, config) pairs for recomputing calendar bounds
+        self._cal_items: Tuple[Tuple[int, TimeframeConfig], ...] = tuple(enumerate(cal_cfgs))
+
+        # Calendar bounds for the UTC day _cal_day. Every calendar boundary is a
+        # function of the UTC date, so they hold for every ts on that day.
+        self._cal_bounds = np.zeros((len(cal_cfgs), 2), dtype=np.int64)
+        self._cal_day: Optional[int] = None
 
     def _bounds_calendar(self, ts: int, cfg: TimeframeConfig):
         dt = datetime.utcfromtimestamp(ts)
@@ -140,10 +282,21 @@ class SyntheticEngine:
 
         return int(start.timestamp()), int(end.timestamp())
 
-    def _bounds_for_tf(self, ts: int, cfg: TimeframeConfig):
-        if cfg.kind == "duration":
-            return self._bounds_duration(ts, cfg.size_seconds)
-        return self._bounds_calendar(ts, cfg)
+    def _calendar_bounds(self, ts: int) -> np.ndarray:
+        day = ts // 86400
+        if day != self._cal_day:
+            for j, cfg in self._cal_items:
+                self._cal_bounds[j] = self._bounds_calendar(ts, cfg)
+            self._cal_day = day
+        return self._cal_bounds
+
+    def _lazy_bounds(self, i: int, ts: int):
+        if i < self._first_cal:
+            size = self._slot_sizes[i]
+            start_ts = ts - ts % size
+            return start_ts, start_ts + size
+        start_ts, end_ts = self._calendar_bounds(ts)[i - self._first_cal].tolist()
+        return start_ts, end_ts
 
     def ingest_tick(self, symbol: str, price: float, volume: float, ts: int):
         """
@@ -153,26 +306,78 @@ class SyntheticEngine:
         if not self.tf_configs:
             return
 
-        for tf_name, cfg in self.tf_configs.items():
-            start_ts, end_ts = self._bounds_for_tf(ts, cfg)
-            sym_state = self.state[symbol]
-            bar = sym_state.get(tf_name)
+        sym_state = self.state.get(symbol)
+        if sym_state is None:
+            sym_state = self.state[symbol] = SymState(self._n_slots)
+
+        ts = int(ts)
+        px = float(price)
+        vol = float(volume or 0.0)
 
-            # New bar if none or boundaries changed
-            if bar is None or bar.start_ts != start_ts or bar.end_ts != end_ts:
-                bar = SyntheticCandle(start_ts, end_ts, price, volume)
-                sym_state[tf_name] = bar
-            else:
-                bar.update(price, volume)
+        # A tick in a new base bar closes the open one: fold it into the lazy
+        # slots before the eager update below overwrites it
+        if self._base is not None:
+            base_start = ts - ts % BASE_SECONDS
+            if base_start != sym_state.base_start:
+                if sym_state.base_start >= 0:
+                    _fold_base_bar(
+                        sym_state.bounds,
+                        sym_state.ohlcv,
+                        self._base,
+                        sym_state.base_start,
+                        self._first_lazy,
+                        self._lazy_sizes,
+                        self._calendar_bounds(sym_state.base_start),
+                    )
+                sym_state.base_start = base_start
+
+        _update_duration_tfs(sym_state.bounds, sym_state.ohlcv, self._eager_sizes, ts, px, vol)
+        sym_state._bytes.clear()
+        sym_state.version += 1
+
+    def _render(self, sym_state: SymState, i: int) -> Tuple[bytes, int, int]:
+        """
+        Materialize slot i and serialize its OHLCV prefix.
+        """
+        if i < self._first_lazy:
+            start_ts = int(sym_state.bounds[i, START])
+            end_ts = start_ts + self._slot_sizes[i]
+            o, h, l, c, v = sym_state.ohlcv[i].tolist()
+        else:
+            # Lazy slot: the open base bar, plus the closed bars folded so far
+            # if they belong to the same bar
+            start_ts, end_ts = self._lazy_bounds(i, sym_state.base_start)
+            o, h, l, c, v = sym_state.ohlcv[self._base].tolist()
+            if sym_state.bounds[i].tolist() == [start_ts, end_ts]:
+                o, lazy_h, lazy_l, _, lazy_v = sym_state.ohlcv[i].tolist()
+                h = max(h, lazy_h)
+                l = min(l, lazy_l)
+                v += lazy_v
+        return _ohlcv_bytes(_iso_start(start_ts), o, h, l, c, v), start_ts, end_ts
+
+    def get_version(self, symbol: str) -> Optional[int]:
+        """
+        Return the tick version for symbol, or None if it has no ticks yet.
+        """
+        sym_state = self.state.get(symbol)
+        if not sym_state:
+            return None
+        return sym_state.version
 
-    def get_candle(self, symbol: str, tf_name: str) -> Optional[Dict]:
+    def get_candle(self, symbol: str, tf_name: str, now_ts: Optional[float] = None) -> Optional[bytes]:
         """
-        Return the latest candle for (symbol, timeframe) or None.
+        Return the latest candle for (symbol, timeframe) as JSON bytes, or None.
+        OHLCV is cached until the next tick; only the time-dependent
+        elapsed/remaining/complete fields are rendered per call.
         """
         sym_state = self.state.get(symbol)
         if not sym_state:
             return None
-        bar = sym_state.get(tf_name)
-        if not bar:
+        i = self._slots.get(tf_name)
+        if i is None:
             return None
-        return bar.to_dict()
+        cached = sym_state._bytes.get(i)
+        if cached is None:
+            cached = sym_state._bytes[i] = self._render(sym_state, i)
+        prefix, start_ts, end_ts = cached
+        return _with_time_fields(prefix, start_ts, end_ts, now_ts)